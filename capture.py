@@ -0,0 +1,178 @@
+# coding=utf-8
+"""
+Pre/post-trigger capture of sensor data.
+
+Sensors continuously record their samples into fixed-size circular buffers, which always hold the last
+few seconds of data. When a trigger fires (a checkpoint or a manual measurement), we wait until
+the post-trigger period elapses, then freeze the window around the trigger and write it into a CSV file
+in a background thread. Buffers are preallocated, so memory use doesn't grow however long the app runs.
+"""
+import csv
+import gettext
+import logging
+import math
+import queue
+import threading
+import time
+from array import array
+from datetime import datetime as dtime
+from pathlib import Path
+
+import tracing
+
+t = gettext.translation('stopwatch', 'l10n', fallback=True)
+_ = t.gettext
+
+LOG_LEVEL = logging.WARNING
+
+
+class CaptureRing(object):
+    """
+    Circular buffer of samples with fixed capacity. Each sample is a timestamp followed by `width - 1` values.
+    When the buffer is full, the oldest sample is overwritten.
+    """
+
+    def __init__(self, capacity: int, width=1):
+        self._capacity = capacity
+        self._width = width
+        self._data = array('d', bytes(8 * capacity * width))
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    def append(self, *sample):
+        with self._lock:
+            offset = self._head * self._width
+
+            for idx in range(self._width):
+                self._data[offset + idx] = sample[idx]
+
+            self._head = (self._head + 1) % self._capacity
+            self._count = min(self._count + 1, self._capacity)
+
+    def window(self, start, end):
+        """ Return samples with a timestamp within <start, end>, oldest first. """
+        # Copy under the lock and filter outside it, so sensor callbacks aren't blocked for long
+        with self._lock:
+            data = self._data[:]
+            head = self._head
+            count = self._count
+
+        samples = []
+        first = (head - count) % self._capacity
+
+        for idx in range(count):
+            offset = ((first + idx) % self._capacity) * self._width
+
+            if start <= data[offset] <= end:
+                samples.append(tuple(data[offset:offset + self._width]))
+
+        return samples
+
+
+class TriggerCapture(object):
+    """
+    Keep the last seconds of RPM pulses, flow pulses and pressure samples and write out
+    the window from T - pre_seconds to T + post_seconds around each trigger.
+    """
+
+    _MAX_PENDING_TRIGGERS = 16
+
+    # Extra buffer space, in case the writer falls behind
+    _SLACK_SECONDS = 1
+
+    def __init__(self, directory, file_prefix='capture', pre_seconds=5, post_seconds=5, max_pulse_rate=500,
+                 pressure_rate=25):
+        self._logger = logging.getLogger('TriggerCapture')
+        self._logger.setLevel(LOG_LEVEL)
+
+        self._directory = Path(directory)
+        self._file_prefix = file_prefix
+        self._pre_seconds = pre_seconds
+        self._post_seconds = post_seconds
+
+        buffer_seconds = pre_seconds + post_seconds + self._SLACK_SECONDS
+        self._rpm_pulses = CaptureRing(math.ceil(buffer_seconds * max_pulse_rate))
+        self._flow_pulses = CaptureRing(math.ceil(buffer_seconds * max_pulse_rate))
+
+        # timestamp, voltage #1, voltage #2, pressure #1, pressure #2
+        self._pressure_samples = CaptureRing(math.ceil(buffer_seconds * pressure_rate), width=5)
+
+        self._triggers = queue.Queue(maxsize=self._MAX_PENDING_TRIGGERS)
+        self._stopping = threading.Event()
+        self._worker = threading.Thread(target=self._write_captures)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def record_rpm_pulse(self, timestamp):
+        self._rpm_pulses.append(timestamp)
+
+    def record_flow_pulse(self, timestamp):
+        self._flow_pulses.append(timestamp)
+
+    def record_pressure(self, timestamp, voltage_1, voltage_2, pressure_1, pressure_2):
+        self._pressure_samples.append(timestamp, voltage_1, voltage_2, pressure_1, pressure_2)
+
+    def trigger(self, label: str, timestamp=None):
+        """ Schedule capture of data around a given moment. Safe to call from any thread. """
+        timestamp = time.time() if timestamp is None else timestamp
+
+        try:
+            self._triggers.put_nowait((label, timestamp))
+        except queue.Full:
+            self._logger.warning(_("Too many pending captures, dropping capture {}").format(label))
+
+    def stop(self):
+        """
+        Write all pending captures and stop the writer. Captures whose post-trigger period
+        hasn't elapsed yet are written with the data recorded so far.
+        """
+        self._stopping.set()
+        self._triggers.put(None)
+        self._worker.join()
+
+    def _write_captures(self):
+        while True:
+            trigger = self._triggers.get()
+
+            if trigger is None:
+                break
+
+            label, timestamp = trigger
+
+            # Wait until the post-trigger data is recorded, unless we are stopping
+            remaining = timestamp + self._post_seconds - time.time()
+            if remaining > 0:
+                self._stopping.wait(remaining)
+
+            start = timestamp - self._pre_seconds
+            end = timestamp + self._post_seconds
+            rpm_pulses = self._rpm_pulses.window(start, end)
+            flow_pulses = self._flow_pulses.window(start, end)
+            pressure_samples = self._pressure_samples.window(start, end)
+
+            self._write_csv(label, timestamp, rpm_pulses, flow_pulses, pressure_samples)
+
+    @tracing.traced('capture_csv_write')
+    def _write_csv(self, label, timestamp, rpm_pulses, flow_pulses, pressure_samples):
+        header = [_('Channel'), _('Time from trigger (s)'), _('Voltage #1 (V)'), _('Voltage #2 (V)'),
+                  _('Pressure #1 (bar)'), _('Pressure #2 (bar)')]
+        path = self._directory / '{}_{}_{}.csv'.format(
+            self._file_prefix, dtime.fromtimestamp(timestamp).strftime('%Y-%m-%d_%H-%M-%S-%f'), label)
+
+        rows = [['rpm', '{:.6f}'.format(sample[0] - timestamp)] for sample in rpm_pulses]
+        rows += [['flow', '{:.6f}'.format(sample[0] - timestamp)] for sample in flow_pulses]
+        rows += [['pressure', '{:.6f}'.format(sample[0] - timestamp), '{:.4f}'.format(sample[1]),
+                  '{:.4f}'.format(sample[2]), int(sample[3]), int(sample[4])] for sample in pressure_samples]
+
+        try:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        except OSError:
+            self._logger.error(_("Unable to write capture file {}.").format(path))
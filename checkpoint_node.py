@@ -0,0 +1,499 @@
+# coding=utf-8
+"""
+Remote checkpoint nodes.
+
+A checkpoint node is a lightweight process running on a remote Raspberry Pi with one or more gates wired
+to its GPIO bus. Each gate edge is timestamped locally and sent to the master (the Pi running the GUI)
+over UDP. The node keeps its clock disciplined to the master using an NTP-style exchange, so the timestamps
+it sends are already expressed in the master's clock. The master merges the edges into the same checkpoint
+state machine which handles the locally wired gates.
+
+Protocol (JSON datagrams):
+    node -> master:  {"type": "sync", "node": id, "t1": node time}
+    master -> node:  {"type": "sync_reply", "t1": ..., "t2": master receive time, "t3": master send time}
+    node -> master:  {"type": "batch", "node": id, "session": boot id, "seq": n,
+                      "edges": [{"id": k, "checkpoint": c, "time": master time}, ...]}
+    master -> node:  {"type": "ack", "session": boot id, "seq": n}
+
+Batches which are not acknowledged in time are retransmitted. The master drops duplicate edges.
+
+To try it out on a single machine, run the master and one or more simulated nodes in separate terminals:
+    python checkpoint_node.py master --port 5005
+    python checkpoint_node.py node --node-id far-gate --master 127.0.0.1:5005 --gate sim:1 \\
+        --simulate-edges 3 --clock-offset 0.8 --clock-drift-ppm 150 --delay 0.02 --jitter 0.01 --loss 0.1
+"""
+import argparse
+import gettext
+import json
+import logging
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+t = gettext.translation('stopwatch', 'l10n', fallback=True)
+_ = t.gettext
+
+DEFAULT_PORT = 5005
+
+LOG_LEVEL = logging.WARNING
+
+
+class SimulatedLink(object):
+    """
+    Outgoing datagram link with optional artificial delay, jitter and packet loss.
+
+    With all parameters set to zero, datagrams are sent immediately.
+    """
+
+    def __init__(self, delay=0.0, jitter=0.0, loss=0.0):
+        self._delay = delay
+        self._jitter = jitter
+        self._loss = loss
+
+    def send(self, sock: socket.socket, data: bytes, address):
+        if self._loss and random.random() < self._loss:
+            return
+
+        latency = self._delay + (random.uniform(-self._jitter, self._jitter) if self._jitter else 0)
+
+        if latency <= 0:
+            self._send_now(sock, data, address)
+        else:
+            timer = threading.Timer(latency, self._send_now, args=(sock, data, address))
+            timer.daemon = True
+            timer.start()
+
+    @staticmethod
+    def _send_now(sock, data, address):
+        try:
+            sock.sendto(data, address)
+        except OSError:
+            # Socket was closed while the datagram was in flight
+            pass
+
+
+class SimulatedClock(object):
+    """ Local clock with a constant offset and drift against the system clock. Used for testing only. """
+
+    def __init__(self, offset=0.0, drift_ppm=0.0):
+        self._offset = offset
+        self._drift = drift_ppm / 1e6
+        self._epoch = time.time()
+
+    def __call__(self):
+        now = time.time()
+        return now + self._offset + (now - self._epoch) * self._drift
+
+
+class ClockSync(object):
+    """
+    Estimate offset and drift of the local clock against the master clock.
+
+    Each sync exchange gives us four timestamps: t1 (request sent, local), t2 (request received, master),
+    t3 (reply sent, master) and t4 (reply received, local). From these we compute:
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay  = (t4 - t1) - (t3 - t2)
+
+    Samples with a long round-trip delay were most likely delayed by jitter, so only the quarter
+    of samples with the lowest delay is used. Drift (slope of offset over local time) is fitted only once
+    there are enough of these samples spread over a long enough time, and it's smoothed between updates.
+    Until then, drift is assumed to be zero. The offset is always anchored to the best of the most recent
+    samples, so an imprecise drift estimate is never extrapolated far.
+    """
+
+    _WINDOW = 128
+    _MIN_SAMPLES = 4
+    _BEST_FRACTION = 0.25
+    _MIN_DRIFT_SAMPLES = 8
+    _MIN_DRIFT_SPAN_SECONDS = 20
+    _DRIFT_GAIN = 0.3
+    _MAX_DRIFT = 500e-6
+    _RECENT_SAMPLES = 8
+    _OFFSET_SAMPLES = 3
+
+    def __init__(self):
+        self._samples = deque(maxlen=self._WINDOW)
+        self._lock = threading.Lock()
+        self._offset = 0.0
+        self._drift = 0.0
+        self._drift_valid = False
+        self._reference = 0.0
+        self._delay = None
+
+    @property
+    def is_synchronized(self):
+        return len(self._samples) >= self._MIN_SAMPLES
+
+    @property
+    def offset(self):
+        return self._offset
+
+    @property
+    def drift(self):
+        return self._drift
+
+    @property
+    def delay(self):
+        return self._delay
+
+    def add_sample(self, t1, t2, t3, t4):
+        delay = (t4 - t1) - (t3 - t2)
+
+        if delay < 0:
+            # Clock stepped during the exchange, the sample is meaningless
+            return
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+
+        with self._lock:
+            self._samples.append(((t1 + t4) / 2, offset, delay))
+            self._update_estimate()
+
+    def _update_estimate(self):
+        samples = list(self._samples)
+        best_count = max(self._MIN_SAMPLES, int(len(samples) * self._BEST_FRACTION))
+        best = sorted(sorted(samples, key=lambda s: s[2])[:best_count])
+
+        if len(best) >= self._MIN_DRIFT_SAMPLES and best[-1][0] - best[0][0] >= self._MIN_DRIFT_SPAN_SECONDS:
+            mean_time = sum(s[0] for s in best) / len(best)
+            mean_offset = sum(s[1] for s in best) / len(best)
+            variance = sum((s[0] - mean_time) ** 2 for s in best)
+            covariance = sum((s[0] - mean_time) * (s[1] - mean_offset) for s in best)
+            drift = max(-self._MAX_DRIFT, min(self._MAX_DRIFT, covariance / variance))
+
+            self._drift = self._drift + self._DRIFT_GAIN * (drift - self._drift) if self._drift_valid else drift
+            self._drift_valid = True
+
+        # Anchor the offset to the samples with the lowest delay, corrected for drift. Without a drift estimate,
+        # use only the most recent ones, otherwise the uncorrected drift would accumulate.
+        if self._drift_valid:
+            anchors = best
+        else:
+            anchors = sorted(samples[-self._RECENT_SAMPLES:], key=lambda s: s[2])[:self._OFFSET_SAMPLES]
+
+        reference = samples[-1][0]
+
+        self._reference = reference
+        self._offset = sum(s[1] + self._drift * (reference - s[0]) for s in anchors) / len(anchors)
+        self._delay = min(s[2] for s in samples)
+
+    def to_master_time(self, local_time):
+        with self._lock:
+            return local_time + self._offset + (local_time - self._reference) * self._drift
+
+
+class CheckpointNode(object):
+    """
+    Timestamp gate edges locally and deliver them in batches to the master.
+
+    Edges are recorded with `record_edge()`, typically from a GPIO callback. They are held back until
+    the clock is synchronized with the master, then converted to master time and sent.
+    """
+
+    _BATCH_INTERVAL = 0.05
+    _MAX_BATCH_SIZE = 32
+    _MAX_UNACKED_BATCHES = 16
+    _ACK_TIMEOUT = 0.25
+    _MAX_ACK_TIMEOUT = 2
+    _SYNC_INTERVAL = 0.5
+    _INITIAL_SYNC_INTERVAL = 0.1
+
+    def __init__(self, node_id: str, master_address, clock=time.time, link: SimulatedLink = None):
+        self._logger = logging.getLogger('CheckpointNode')
+        self._logger.setLevel(LOG_LEVEL)
+
+        self._node_id = node_id
+        self._session = uuid.uuid4().hex
+        self._master_address = master_address
+        self._clock = clock
+        self._link = link if link is not None else SimulatedLink()
+        self._clock_sync = ClockSync()
+
+        self._lock = threading.Lock()
+        self._pending_edges = deque()
+        self._unacked_batches = {}
+        self._next_edge_id = 0
+        self._next_seq = 0
+        self._last_sync = 0
+
+        self._running = False
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.settimeout(self._BATCH_INTERVAL)
+        self._workers = []
+
+    @property
+    def clock_sync(self):
+        return self._clock_sync
+
+    def start(self):
+        self._running = True
+
+        for target in (self._receive_loop, self._send_loop):
+            worker = threading.Thread(target=target)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        self._running = False
+
+        for worker in self._workers:
+            worker.join()
+
+        self._socket.close()
+
+    def record_edge(self, checkpoint: int):
+        """ Store an edge on a given checkpoint. Safe to call from any thread. """
+        local_time = self._clock()
+
+        with self._lock:
+            self._pending_edges.append((self._next_edge_id, checkpoint, local_time))
+            self._next_edge_id += 1
+
+        return local_time
+
+    def _send(self, message: dict):
+        self._link.send(self._socket, json.dumps(message).encode(), self._master_address)
+
+    def _send_loop(self):
+        while self._running:
+            now = time.time()
+            sync_interval = self._SYNC_INTERVAL if self._clock_sync.is_synchronized \
+                else self._INITIAL_SYNC_INTERVAL
+
+            if now - self._last_sync >= sync_interval:
+                self._last_sync = now
+                self._send({'type': 'sync', 'node': self._node_id, 't1': self._clock()})
+
+            if self._clock_sync.is_synchronized:
+                self._flush_pending_edges()
+                self._retransmit(now)
+
+            time.sleep(self._BATCH_INTERVAL)
+
+    def _flush_pending_edges(self):
+        with self._lock:
+            if not self._pending_edges or len(self._unacked_batches) >= self._MAX_UNACKED_BATCHES:
+                return
+
+            edges = []
+            while self._pending_edges and len(edges) < self._MAX_BATCH_SIZE:
+                edge_id, checkpoint, local_time = self._pending_edges.popleft()
+                edges.append({'id': edge_id, 'checkpoint': checkpoint,
+                              'time': self._clock_sync.to_master_time(local_time)})
+
+            batch = {'type': 'batch', 'node': self._node_id, 'session': self._session,
+                     'seq': self._next_seq, 'edges': edges}
+            self._unacked_batches[self._next_seq] = {'message': batch, 'sent': time.time(),
+                                                     'timeout': self._ACK_TIMEOUT}
+            self._next_seq += 1
+
+        self._send(batch)
+
+    def _retransmit(self, now):
+        with self._lock:
+            expired = [batch for batch in self._unacked_batches.values() if now - batch['sent'] >= batch['timeout']]
+
+            for batch in expired:
+                batch['sent'] = now
+                batch['timeout'] = min(batch['timeout'] * 2, self._MAX_ACK_TIMEOUT)
+
+        for batch in expired:
+            self._logger.debug(_("Retransmitting batch {}").format(batch['message']['seq']))
+            self._send(batch['message'])
+
+    def _receive_loop(self):
+        while self._running:
+            try:
+                data, _address = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            receive_time = self._clock()
+
+            try:
+                message = json.loads(data.decode())
+                message_type = message['type']
+
+                if message_type == 'sync_reply':
+                    self._clock_sync.add_sample(message['t1'], message['t2'], message['t3'], receive_time)
+                elif message_type == 'ack' and message['session'] == self._session:
+                    with self._lock:
+                        self._unacked_batches.pop(message['seq'], None)
+            except (ValueError, KeyError, TypeError):
+                self._logger.warning(_("Malformed message received from the master"))
+
+
+class CheckpointMaster(object):
+    """
+    Receive gate edges from remote checkpoint nodes.
+
+    The master answers sync requests, acknowledges batches and passes every edge exactly once
+    to `on_edge(node_id, checkpoint, timestamp)`. The timestamp is expressed in the master's clock.
+    """
+
+    _DEDUPLICATION_WINDOW = 1024
+
+    def __init__(self, on_edge, port=DEFAULT_PORT, host='0.0.0.0', clock=time.time, link: SimulatedLink = None):
+        self._logger = logging.getLogger('CheckpointMaster')
+        self._logger.setLevel(LOG_LEVEL)
+
+        self._on_edge = on_edge
+        self._clock = clock
+        self._link = link if link is not None else SimulatedLink()
+
+        # (node, session) -> recently seen edge ids
+        self._seen_edges = {}
+
+        self._running = False
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.settimeout(0.1)
+        self._worker = None
+
+    @property
+    def port(self):
+        """ Port the master listens on, useful when bound to port 0. """
+        return self._socket.getsockname()[1]
+
+    def start(self):
+        self._running = True
+        self._worker = threading.Thread(target=self._receive_loop)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def stop(self):
+        self._running = False
+
+        if self._worker is not None:
+            self._worker.join()
+
+        self._socket.close()
+
+    def _receive_loop(self):
+        while self._running:
+            try:
+                data, address = self._socket.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            receive_time = self._clock()
+
+            try:
+                message = json.loads(data.decode())
+                message_type = message['type']
+
+                if message_type == 'sync':
+                    reply = {'type': 'sync_reply', 't1': message['t1'], 't2': receive_time}
+                    reply['t3'] = self._clock()
+                    self._send(reply, address)
+                elif message_type == 'batch':
+                    self._process_batch(message, address)
+            except (ValueError, KeyError, TypeError):
+                self._logger.warning(_("Malformed message received from {}").format(address))
+
+    def _process_batch(self, message, address):
+        node_id = message['node']
+        key = (node_id, message['session'])
+
+        if key not in self._seen_edges:
+            self._seen_edges[key] = deque(maxlen=self._DEDUPLICATION_WINDOW)
+
+        seen = self._seen_edges[key]
+        new_edges = [edge for edge in message['edges'] if edge['id'] not in seen]
+        seen.extend(edge['id'] for edge in new_edges)
+
+        # Acknowledge even duplicate batches, the previous ack might have been lost
+        self._send({'type': 'ack', 'session': message['session'], 'seq': message['seq']}, address)
+
+        for edge in sorted(new_edges, key=lambda e: e['time']):
+            self._on_edge(node_id, int(edge['checkpoint']), float(edge['time']))
+
+    def _send(self, message: dict, address):
+        self._link.send(self._socket, json.dumps(message).encode(), address)
+
+
+def _parse_gate(value: str):
+    pin, checkpoint = value.split(':')
+    return pin, int(checkpoint)
+
+
+def _parse_address(value: str):
+    host, port = value.rsplit(':', 1)
+    return host, int(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=_('Remote checkpoint node for the Firefighter Stopwatch'))
+    parser.add_argument('mode', choices=['node', 'master'])
+    parser.add_argument('--node-id', default=socket.gethostname())
+    parser.add_argument('--master', type=_parse_address, default=('127.0.0.1', DEFAULT_PORT),
+                        help='master address as host:port')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port the master listens on')
+    parser.add_argument('--gate', type=_parse_gate, action='append', default=[],
+                        help='gate as pin:checkpoint, use "sim" instead of the pin for a simulated gate')
+    parser.add_argument('--simulate-edges', type=float, default=0,
+                        help='trigger simulated gates every N seconds')
+    parser.add_argument('--clock-offset', type=float, default=0, help='simulated clock offset (s)')
+    parser.add_argument('--clock-drift-ppm', type=float, default=0, help='simulated clock drift (ppm)')
+    parser.add_argument('--delay', type=float, default=0, help='simulated network delay (s)')
+    parser.add_argument('--jitter', type=float, default=0, help='simulated network jitter (s)')
+    parser.add_argument('--loss', type=float, default=0, help='simulated packet loss (0..1)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s %(name)s: %(message)s', level=logging.INFO)
+    link = SimulatedLink(args.delay, args.jitter, args.loss)
+
+    if args.mode == 'master':
+        def print_edge(node_id, checkpoint, timestamp):
+            logging.info(_("Edge from {} on checkpoint {}: {:.6f} (received {:.6f})").format(
+                node_id, checkpoint, timestamp, time.time()))
+
+        master = CheckpointMaster(print_edge, port=args.port, link=link)
+        master.start()
+    else:
+        clock = SimulatedClock(args.clock_offset, args.clock_drift_ppm) \
+            if args.clock_offset or args.clock_drift_ppm else time.time
+        node = CheckpointNode(args.node_id, args.master, clock=clock, link=link)
+        simulated_gates = [checkpoint for pin, checkpoint in args.gate if pin == 'sim']
+        buttons = []
+
+        for pin, checkpoint in args.gate:
+            if pin != 'sim':
+                import gpiozero
+
+                button = gpiozero.Button(int(pin), pull_up=True, bounce_time=0.01)
+                button.when_pressed = lambda checkpoint=checkpoint: node.record_edge(checkpoint)
+                buttons.append(button)
+
+        node.start()
+
+    try:
+        while True:
+            time.sleep(args.simulate_edges if args.mode == 'node' and args.simulate_edges else 1)
+
+            if args.mode == 'node':
+                sync = node.clock_sync
+                logging.info(_("Clock offset {:+.6f} s, drift {:+.1f} ppm, delay {}").format(
+                    sync.offset, sync.drift * 1e6, sync.delay))
+
+                if args.simulate_edges:
+                    for checkpoint in simulated_gates:
+                        true_time = time.time()
+                        node.record_edge(checkpoint)
+                        logging.info(_("Simulated edge on checkpoint {}: {:.6f}").format(checkpoint, true_time))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# coding=utf-8
+"""
+Run lifecycle for competition days.
+
+Teams run in the order given by a start list. Each run is assigned to the current team when it starts.
+Once the run is archived, its result is stored in an in-memory index and the next team becomes current.
+The last archive can be undone for a short time, e.g. when a run has to be repeated.
+
+This module only keeps the state, the caller decides when to archive.
+"""
+import bisect
+import csv
+import gettext
+import logging
+import time
+from datetime import datetime as dtime
+
+t = gettext.translation('stopwatch', 'l10n', fallback=True)
+_ = t.gettext
+
+LOG_LEVEL = logging.WARNING
+
+
+def load_start_list(path):
+    """
+    Load team names from a CSV or plain text file. Team name is in the first column,
+    empty lines and lines starting with '#' are skipped.
+    """
+    teams = []
+
+    with open(path, 'r', newline='') as f:
+        for row in csv.reader(f):
+            if row and row[0].strip() and not row[0].startswith('#'):
+                teams.append(row[0].strip())
+
+    return teams
+
+
+class RunResult(object):
+    def __init__(self, run_id: str, team):
+        self.run_id = run_id
+        self.team = team
+
+        # checkpoint -> split time in seconds
+        self.splits = {}
+
+    @property
+    def total(self):
+        """ Time of the stop gate which was triggered last, or None if the run didn't finish. """
+        stops = [self.splits[checkpoint] for checkpoint in (1, 2) if checkpoint in self.splits]
+        return max(stops) if len(stops) == 2 else None
+
+
+class RunManager(object):
+    def __init__(self, teams, undo_window_seconds=15, clock=time.monotonic):
+        self._logger = logging.getLogger('RunManager')
+        self._logger.setLevel(LOG_LEVEL)
+
+        self._teams = list(teams)
+        self._team_idx = 0
+        self._undo_window = undo_window_seconds
+        self._clock = clock
+
+        self._session = dtime.now().strftime('%Y%m%d-%H%M')
+        self._run_counter = 0
+        self._current_run = None
+
+        # Index of archived runs: run id -> result, team -> results
+        self._results = {}
+        self._team_results = {}
+
+        # Best total per team and (total, team) pairs sorted from the best one
+        self._best_totals = {}
+        self._standings = []
+
+        self._last_archived = None
+        self._undo_deadline = None
+        self._undo_team_idx = None
+
+    @property
+    def current_team(self):
+        return self._teams[self._team_idx] if self._team_idx < len(self._teams) else None
+
+    @property
+    def next_team(self):
+        return self._teams[self._team_idx + 1] if self._team_idx + 1 < len(self._teams) else None
+
+    @property
+    def current_run(self):
+        return self._current_run
+
+    @property
+    def last_archived(self):
+        return self._last_archived
+
+    def start_run(self):
+        """ Assign a new run to the current team. """
+        self._run_counter += 1
+        self._current_run = RunResult('{}-{:03d}'.format(self._session, self._run_counter), self.current_team)
+        self._undo_deadline = None
+        return self._current_run
+
+    def record_split(self, checkpoint: int, seconds: float):
+        if self._current_run is not None:
+            self._current_run.splits[checkpoint] = seconds
+
+    def discard_run(self):
+        """ Drop the current run without archiving. The team stays current. """
+        self._current_run = None
+
+    def archive_run(self):
+        """ Store the current run into the index and move to the next team. """
+        run = self._current_run
+
+        if run is None:
+            return None
+
+        self._current_run = None
+        self._results[run.run_id] = run
+        self._team_results.setdefault(run.team, []).append(run)
+        self._update_best_total(run.team)
+        self._undo_team_idx = self._team_idx
+
+        if self._team_idx < len(self._teams):
+            self._team_idx += 1
+
+        self._last_archived = run
+        self._undo_deadline = self._clock() + self._undo_window
+        self._logger.info(_("Run {} of team {} archived").format(run.run_id, run.team))
+        return run
+
+    @property
+    def can_undo(self):
+        return self._undo_deadline is not None and self._clock() <= self._undo_deadline
+
+    def undo_archive(self):
+        """ Revert the last archive within the undo window. The team of the reverted run becomes current again. """
+        if not self.can_undo:
+            return None
+
+        run = self._last_archived
+        del self._results[run.run_id]
+        self._team_results[run.team].remove(run)
+        self._update_best_total(run.team)
+        self._team_idx = self._undo_team_idx
+
+        self._last_archived = None
+        self._undo_deadline = None
+        self._logger.info(_("Archive of run {} of team {} reverted").format(run.run_id, run.team))
+        return run
+
+    def _update_best_total(self, team):
+        if team is None:
+            return
+
+        if team in self._best_totals:
+            old_entry = (self._best_totals.pop(team), team)
+            del self._standings[bisect.bisect_left(self._standings, old_entry)]
+
+        totals = [run.total for run in self._team_results.get(team, []) if run.total is not None]
+
+        if totals:
+            self._best_totals[team] = min(totals)
+            bisect.insort(self._standings, (self._best_totals[team], team))
+
+    def standings(self):
+        """ List of (team, best total) sorted from the fastest team. """
+        return [(team, total) for total, team in self._standings]
+
+    def rank(self, team):
+        """ Position of a team in standings starting from 1, or None if it has no finished run. """
+        if team not in self._best_totals:
+            return None
+
+        return bisect.bisect_left(self._standings, (self._best_totals[team], team)) + 1
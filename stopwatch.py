@@ -17,6 +17,11 @@ from datetime import datetime as dtime
 from pathlib import Path
 from tkinter import ttk
 
+import tracing
+from capture import TriggerCapture
+from checkpoint_node import CheckpointMaster, DEFAULT_PORT as REMOTE_CHECKPOINTS_DEFAULT_PORT
+from run_lifecycle import RunManager, load_start_list
+
 import gettext
 t = gettext.translation('stopwatch', 'l10n')
 _ = t.gettext
@@ -37,6 +42,12 @@ FLOW_Q_DEFAULT_VALUE = 0.229
 PRESSURE_K_DEFAULT_VALUE = 20
 PRESSURE_Q_DEFAULT_VALUE = 0
 MANUAL_MEASUREMENT_DATA_DISPLAY_SECONDS = 2
+CAPTURE_PRE_SECONDS_DEFAULT_VALUE = 5
+CAPTURE_POST_SECONDS_DEFAULT_VALUE = 5
+CAPTURE_MAX_PULSE_RATE_DEFAULT_VALUE = 500  # Hz, the highest expected rate of RPM or flow pulses
+START_LIST_PATH = 'start_list.csv'
+RUN_ARCHIVE_DELAY_DEFAULT_SECONDS = 10
+RUN_UNDO_WINDOW_DEFAULT_SECONDS = 15
 
 LOG_LEVEL = logging.WARNING
 
@@ -45,10 +56,17 @@ class MainApp(object):
     _SCREEN_REFRESH_MS = 40
     _MEASURE_ORDER_PADDING = (50, 0)
 
+    # Values of the flag column in the results CSV
+    _FLAG_AUTO = 'A'
+    _FLAG_MANUAL = 'M'
+    _FLAG_DISCARDED = 'D'
+    _FLAG_REVERTED = 'U'
+
     def __init__(self, parent):
         self._logger = logging.getLogger('MainApp')
         self._logger.setLevel(LOG_LEVEL)
         self._load_config()
+        self._configure_tracing()
 
         self._parent = parent
         self._parent.title(_('Firefighter Stopwatch'))
@@ -172,22 +190,196 @@ class MainApp(object):
         self._manual_measurement_labels['pressure'].append(label)
         self._manual_measurement_running = False
 
+        # Run lifecycle: current and next team from the start list, last archived run
+        self._run_manager = None
+        self._archive_job = None
+        self._team_labels = {}
+
+        if self.configuration is not None and self.configuration.get('runs', {}).get('enabled'):
+            try:
+                teams = load_start_list(self.configuration['runs'].get('start_list', START_LIST_PATH))
+                self._run_manager = RunManager(teams, undo_window_seconds=self.configuration['runs'].get(
+                    'undo_window_seconds', RUN_UNDO_WINDOW_DEFAULT_SECONDS))
+            except OSError:
+                self._logger.error(_("Unable to load start list. Check path in \'config.json\'."))
+
+        if self._run_manager is not None:
+            for row, key in enumerate(['teams', 'last_run']):
+                label = ttk.Label(content_frame, style='Customized.Main.TLabel', padding=10)
+                label.grid(column=0, row=10 + row, columnspan=5)
+                self._team_labels[key] = label
+
+            self._update_team_labels()
+
         # Queue for UI thread to update components
         self._thread_queue = queue.Queue()
+        self._last_tick = None
         self._parent.after(self._SCREEN_REFRESH_MS, self._update_ui)
 
+        # Sensor data around checkpoints. Must exist before sensors start recording.
+        self.capture = None
+
+        if self.configuration is not None and self.configuration.get('capture', {}).get('enabled'):
+            log_path = Path(self.get_log_path())
+            self.capture = TriggerCapture(
+                log_path.parent, file_prefix=log_path.stem + '_capture',
+                pre_seconds=self.configuration['capture'].get('pre_seconds', CAPTURE_PRE_SECONDS_DEFAULT_VALUE),
+                post_seconds=self.configuration['capture'].get('post_seconds', CAPTURE_POST_SECONDS_DEFAULT_VALUE),
+                max_pulse_rate=self.configuration['capture'].get('max_pulse_rate',
+                                                                 CAPTURE_MAX_PULSE_RATE_DEFAULT_VALUE),
+                pressure_rate=PressureTransducer.SAMPLES_PER_SECOND)
+
         self._stopwatch = StopWatch(self)
         self._rpmmeter = RpmMeter(self)
         self._flowmeter = FlowMeter(self)
         self._pressure = PressureTransducer(self)
+        self._checkpoint_master = None
+
+        if self.configuration is not None and self.configuration.get('remote_checkpoints', {}).get('enabled'):
+            try:
+                self._checkpoint_master = CheckpointMaster(
+                    lambda node_id, checkpoint, timestamp: self._stopwatch.process_remote_edge(checkpoint, timestamp),
+                    port=self.configuration['remote_checkpoints'].get('port', REMOTE_CHECKPOINTS_DEFAULT_PORT))
+                self._checkpoint_master.start()
+            except OSError:
+                self._logger.error(_("Unable to listen for remote checkpoints. Check port in \'config.json\'."))
 
     # noinspection PyUnusedLocal
     def close(self, *args):
+        if self._checkpoint_master is not None:
+            self._checkpoint_master.stop()
+
+        if self.capture is not None:
+            self.capture.stop()
+
         self._parent.quit()
 
     def post_on_ui_thread(self, value):
         self._thread_queue.put(value)
 
+    def _update_team_labels(self):
+        self._team_labels['teams']['text'] = _('Team: {}    Next: {}').format(
+            self._run_manager.current_team or '-', self._run_manager.next_team or '-')
+
+        run = self._run_manager.last_archived
+        if run is None:
+            self._team_labels['last_run']['text'] = ''
+        else:
+            total = run.total
+            rank = self._run_manager.rank(run.team)
+            self._team_labels['last_run']['text'] = _('Last run: {}  {}  {}').format(
+                run.team or '-', StopWatch._format_time(total) if total is not None else '-',
+                '({}.)'.format(rank) if rank is not None else '')
+
+            if self._run_manager.can_undo:
+                self._team_labels['last_run']['text'] += '  ' + _('(hold reset to undo)')
+
+    def _schedule_run_archive(self):
+        """ Archive the run and re-arm the stopwatch after a delay, so the operator can see the results. """
+        if self._run_manager is None:
+            return
+
+        delay = self.configuration['runs'].get('archive_delay_seconds', RUN_ARCHIVE_DELAY_DEFAULT_SECONDS)
+        self._archive_job = self._parent.after(int(delay * 1000), self._archive_run)
+
+    def _archive_run(self, rearm=True):
+        self._archive_job = None
+        self._run_manager.archive_run()
+
+        if rearm:
+            self._stopwatch.rearm()
+
+        self._update_team_labels()
+
+        # Remove the undo hint once the undo window expires
+        self._parent.after(int(self.configuration['runs'].get(
+            'undo_window_seconds', RUN_UNDO_WINDOW_DEFAULT_SECONDS) * 1000) + 100, self._update_team_labels)
+
+    def _handle_operator_reset(self):
+        """
+        Reset button pressed. A finished run waiting for archive is archived right away, the watch
+        has already been reset. Otherwise the run in progress is dropped and the same team will run again.
+        """
+        if self._run_manager is None:
+            return
+
+        if self._archive_job is not None:
+            self._parent.after_cancel(self._archive_job)
+            self._archive_run(rearm=False)
+        else:
+            run = self._run_manager.current_run
+            self._run_manager.discard_run()
+
+            # Rows of this run are already in the results file, mark them as not valid
+            if run is not None:
+                self._write_log_to_csv(flag=self._FLAG_DISCARDED, run=run)
+
+        self._update_team_labels()
+
+    def _handle_undo_request(self):
+        """ Reset button held. Within the undo window, the last archive is reverted and its team is current again. """
+        if self._run_manager is None:
+            return
+
+        run = self._run_manager.undo_archive()
+
+        if run is not None:
+            self._write_log_to_csv(flag=self._FLAG_REVERTED, run=run)
+
+        self._update_team_labels()
+
+    @tracing.traced('csv_write')
+    def _write_log_to_csv(self, checkpoint='', split_time='', flow='', rpm='',
+                          pressure_1='', pressure_2='', flag=_FLAG_AUTO, run=None):
+        """
+        Append a row into the results file. With the run lifecycle enabled, the row belongs to a given run,
+        or to the current one if not given.
+        """
+        write_header = False
+        header = [_('Measurement date and time'), _('Checkpoint'), _('Time'), _('Flow (l/min)'),
+                  _('Engine revs (1/min)'), _('Pressure #1 (bar)'), _('Pressure #2 (bar)'),
+                  _('Flag for auto/manual measurement {A, M}')]
+
+        data = [dtime.now().isoformat(), checkpoint, split_time, flow, rpm, pressure_1, pressure_2, flag]
+
+        if self._run_manager is not None:
+            header[-1] = _('Flag for auto/manual measurement, discarded/reverted run {A, M, D, U}')
+            header += [_('Run ID'), _('Team')]
+            run = self._run_manager.current_run if run is None else run
+
+            if run is None:
+                data += ['', self._run_manager.current_team or '']
+            else:
+                data += [run.run_id, run.team or '']
+
+        csv_file = self.get_log_path()
+
+        if not Path(csv_file).exists():
+            write_header = True
+
+        try:
+            with open(csv_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+
+                if write_header:
+                    writer.writerow(header)
+
+                writer.writerow(data)
+        except FileNotFoundError:
+            self._logger.error(_("Unable to create log file. Check path in \'config.json\'."))
+
+    def get_log_path(self):
+        """ Path to the CSV file with results. """
+        csv_file = CSV_FILE_PATH
+
+        if self.configuration is not None:
+            try:
+                csv_file = self.configuration['logging']['location']
+            except KeyError or AttributeError:
+                csv_file = CSV_FILE_PATH
+
+        return csv_file
+
     def _load_config(self, path=CONFIG_PATH):
         """
         Load configuration from local JSON file. For all mandatory parameters
@@ -197,6 +389,17 @@ class MainApp(object):
         with open(path, 'r') as f:
             self.configuration = json.loads(f.read())
 
+    def _configure_tracing(self):
+        """
+        Enable tracing of hot paths if requested in config. The trace is written on exit
+        and whenever the app receives SIGUSR1.
+        """
+        if self.configuration is not None and self.configuration.get('tracing', {}).get('enabled'):
+            tracing.configure(buffer_size=self.configuration['tracing'].get('buffer_size',
+                                                                             tracing.DEFAULT_BUFFER_SIZE),
+                              path=self.configuration['tracing'].get('location', tracing.DEFAULT_TRACE_PATH))
+
+    @tracing.traced('ui_tick')
     def _update_ui(self):
         """ Refresh UI """
 
@@ -249,38 +452,6 @@ class MainApp(object):
                                  flow='', pressure='',
                                  is_manual_measure=True)
 
-        def write_log_to_csv(checkpoint='', split_time='', flow='', rpm='',
-                             pressure_1='', pressure_2='', is_manual_measure=False):
-            write_header = False
-            header = [_('Measurement date and time'), _('Checkpoint'), _('Time'), _('Flow (l/min)'),
-                      _('Engine revs (1/min)'), _('Pressure #1 (bar)'), _('Pressure #2 (bar)'),
-                      _('Flag for auto/manual measurement {A, M}')]
-
-            data = [dtime.now().isoformat(), checkpoint, split_time, flow, rpm, pressure_1, pressure_2,
-                    'A' if not is_manual_measure else 'M']
-
-            csv_file = None
-
-            if self.configuration is not None:
-                try:
-                    csv_file = self.configuration['logging']['location']
-                except KeyError or AttributeError:
-                    csv_file = CSV_FILE_PATH
-
-            if not Path(csv_file).exists():
-                write_header = True
-
-            try:
-                with open(csv_file, 'a', newline='') as f:
-                    writer = csv.writer(f)
-
-                    if write_header:
-                        writer.writerow(header)
-
-                    writer.writerow(data)
-            except FileNotFoundError:
-                self._logger.error(_("Unable to create log file. Check path in \'config.json\'."))
-
         def get_row_for_checkpoint(checkpoint: int):
             # checkpoint -> row mapping
             mapping = {4: 0,
@@ -290,16 +461,37 @@ class MainApp(object):
 
             return mapping.get(checkpoint)
 
-        update_ui_stopwatch_time(self._stopwatch.get_current_time())
-        update_ui_set_current_measurement_data()
+        if tracing.enabled():
+            # Report ticks which came much later than scheduled, e.g. because the GIL was held by another thread
+            now = time.perf_counter()
+            if self._last_tick is not None and now - self._last_tick > 2 * self._SCREEN_REFRESH_MS / 1000:
+                tracing.instant('ui_tick_overrun', interval_ms=(now - self._last_tick) * 1000)
+            self._last_tick = now
+
+        with tracing.span('update_stopwatch_time'):
+            update_ui_stopwatch_time(self._stopwatch.get_current_time())
+
+        with tracing.span('update_current_measurement_data'):
+            update_ui_set_current_measurement_data()
 
         try:
-            event = self._thread_queue.get(False)
+            with tracing.span('get_event'):
+                event = self._thread_queue.get(False)
 
             # Events without data
             if type(event) == str:
                 if event == StopWatch.STOPWATCH_RESET:
                     clear_measurement_data()
+                    self._handle_operator_reset()
+                if event == StopWatch.STOPWATCH_REARMED:
+                    clear_measurement_data()
+
+                    if self._run_manager is not None:
+                        self._update_team_labels()
+                if event == StopWatch.STOPWATCH_STOPPED:
+                    self._schedule_run_archive()
+                if event == StopWatch.RUN_UNDO_REQUESTED:
+                    self._handle_undo_request()
                 if event == StopWatch.MANUAL_MEASURE_ENDED:
                     self._manual_measurement_labels['symbol_label'].grid_remove()
                     self._manual_measurement_labels['split_times'][0].grid_remove()
@@ -307,11 +499,19 @@ class MainApp(object):
 
             # Events with data as dicts (key = value)
             elif type(event) == dict:
+                tracing.instant('ui_event', keys=list(event.keys()))
                 checkpoint = None
 
                 for eventKey, eventValue in event.items():
                     if eventKey == StopWatch.SPLIT_TIME_MEASURED:
                         checkpoint = event.get(StopWatch.CHECKPOINT)
+
+                        if self._run_manager is not None:
+                            if checkpoint == 4:
+                                self._run_manager.start_run()
+                                self._update_team_labels()
+                            self._run_manager.record_split(checkpoint, event.get(StopWatch.SPLIT_SECONDS))
+
                         flow = str(self._flowmeter.get_current_flow())
                         pressure = self._pressure.get_sliding_avg_pressure()
                         rpm = str(self._rpmmeter.get_current_rpm())
@@ -321,9 +521,9 @@ class MainApp(object):
                                              pressure='{}/{}'.format(pressure[0], pressure[1]))
 
                         if checkpoint:
-                            write_log_to_csv(checkpoint=checkpoint, split_time=eventValue,
-                                             flow=flow, rpm=rpm, pressure_1=str(pressure[0]),
-                                             pressure_2=str(pressure[1]))
+                            self._write_log_to_csv(checkpoint=checkpoint, split_time=eventValue,
+                                                   flow=flow, rpm=rpm, pressure_1=str(pressure[0]),
+                                                   pressure_2=str(pressure[1]))
 
                     elif eventKey == StopWatch.MANUAL_MEASURE_STARTED:
                         checkpoint = event.get(StopWatch.CHECKPOINT)
@@ -335,9 +535,9 @@ class MainApp(object):
                                              rpm=rpm, flow=flow,
                                              pressure='{}/{}'.format(pressure[0], pressure[1]))
 
-                        write_log_to_csv(split_time=eventValue,
-                                         flow=flow, rpm=rpm, pressure_1=str(pressure[0]),
-                                         pressure_2=str(pressure[1]), is_manual_measure=True)
+                        self._write_log_to_csv(split_time=eventValue,
+                                               flow=flow, rpm=rpm, pressure_1=str(pressure[0]),
+                                               pressure_2=str(pressure[1]), flag=self._FLAG_MANUAL)
 
                 if checkpoint is not None:
                     self._logger.info(_("Split time measured on checkpoint {}").format(checkpoint))
@@ -353,10 +553,13 @@ class StopWatch(object):
     STOPWATCH_STARTED = 'stopwatch_started'
     STOPWATCH_STOPPED = 'stopwatch_stopped'
     STOPWATCH_RESET = 'stopwatch_reset'
+    STOPWATCH_REARMED = 'stopwatch_rearmed'
+    RUN_UNDO_REQUESTED = 'run_undo_requested'
     SPLIT_TIME_MEASURED = 'split_time_measured'
     MANUAL_MEASURE_STARTED = 'manual_measure_started'
     MANUAL_MEASURE_ENDED = 'manual_measure_ended'
     CHECKPOINT = 'checkpoint'
+    SPLIT_SECONDS = 'split_seconds'
 
     # GPIO input pins
     _STOPWATCH_TRIGGER_PIN = 7
@@ -369,6 +572,12 @@ class StopWatch(object):
     _STOPWATCH_RESET_PIN = 21
     _MANUAL_MEASURE_PIN = 20
 
+    # Holding the reset button this long reverts the last archived run
+    _UNDO_HOLD_SECONDS = 2
+
+    # Remote edges delayed longer than this are not trusted, e.g. when a node was cut off for a while
+    _MAX_REMOTE_EDGE_AGE_SECONDS = 30
+
     def __init__(self, parent: MainApp):
         self._logger = logging.getLogger('StopWatch')
         self._logger.setLevel(LOG_LEVEL)
@@ -385,28 +594,39 @@ class StopWatch(object):
         self._checkpoint_1_measured = False
         self._checkpoint_2_measured = False
 
+        # Remote edges from before the last reset belong to a previous run
+        self._reset_time = time.time()
+
+        # Gate edges come from GPIO callbacks as well as from remote checkpoint nodes
+        self._lock = threading.RLock()
+
         try:
             # FIXME: All buttons except the first one cause 'when_pressed' to be triggered right after init.
             # Suspecting a bug in gpiozero library. Order of buttons is not relevant to reproduce this issue.
             # Apparently this bug does occur only on a PC, not RPi.
 
             start_button = gpiozero.Button(self._STOPWATCH_TRIGGER_PIN, pull_up=True, bounce_time=0.01)
-            start_button.when_pressed = lambda: self._start_watch()
+            start_button.when_pressed = tracing.traced('gpio:_start_watch')(lambda: self._start_watch())
 
             split_time_button = gpiozero.Button(self._STOPWATCH_SPLIT_TIME_TRIGGER_PIN, pull_up=True, bounce_time=0.01)
-            split_time_button.when_pressed = lambda: self._measure_first_split_time()
+            split_time_button.when_pressed = tracing.traced('gpio:_measure_first_split_time')(
+                lambda: self._measure_first_split_time())
 
             stop_button_1 = gpiozero.Button(self._STOPWATCH_STOP_TRIGGER_PINS[0], pull_up=True, bounce_time=0.01)
-            stop_button_1.when_pressed = lambda button: self._stop_watch(button)
+            stop_button_1.when_pressed = tracing.traced('gpio:_stop_watch')(lambda: self._stop_watch(checkpoint=1))
 
             stop_button_2 = gpiozero.Button(self._STOPWATCH_STOP_TRIGGER_PINS[1], pull_up=True, bounce_time=0.01)
-            stop_button_2.when_pressed = lambda button: self._stop_watch(button)
+            stop_button_2.when_pressed = tracing.traced('gpio:_stop_watch')(lambda: self._stop_watch(checkpoint=2))
 
             manual_measure_button = gpiozero.Button(self._MANUAL_MEASURE_PIN, pull_up=True, bounce_time=0.01)
-            manual_measure_button.when_pressed = lambda: self._run_manual_measurement()
+            manual_measure_button.when_pressed = tracing.traced('gpio:_run_manual_measurement')(
+                lambda: self._run_manual_measurement())
 
-            reset_button = gpiozero.Button(self._STOPWATCH_RESET_PIN, pull_up=True, bounce_time=0.01)
-            reset_button.when_pressed = lambda: self._reset_watch()
+            reset_button = gpiozero.Button(self._STOPWATCH_RESET_PIN, pull_up=True, bounce_time=0.01,
+                                           hold_time=self._UNDO_HOLD_SECONDS)
+            reset_button.when_pressed = tracing.traced('gpio:_reset_watch')(lambda: self._reset_watch())
+            reset_button.when_held = tracing.traced('gpio:_request_undo')(
+                lambda: self._parent.post_on_ui_thread(self.RUN_UNDO_REQUESTED))
 
             self._buttons = {'start_button': start_button, 'split_time_button': split_time_button,
                              'stop_button_1': stop_button_1, 'stop_button_2': stop_button_2,
@@ -421,65 +641,105 @@ class StopWatch(object):
     def is_running(self):
         return self._is_running
 
-    def _start_watch(self):
-        if self._cleared and not self.is_running:
-            self._measure_split_time(checkpoint=4)
-            self._cleared = False
-            self._is_running = True
-            self._parent.post_on_ui_thread(self.STOPWATCH_STARTED)
-
-    def _measure_first_split_time(self):
-        if self.is_running:
-            if self._first_split_time_measured:
-                self._logger.warning(_("Repeated measure on checkpoint 3"))
-                return
-
-            self._measure_split_time(checkpoint=3)
-            self._first_split_time_measured = True
-
-    def _stop_watch(self, button_id):
-        if self._first_split_time_measured and self.is_running:
-            if button_id == self._buttons['stop_button_1']:
-                if self._checkpoint_1_measured:
-                    self._logger.warning(_("Repeated measure on checkpoint 1"))
-                    return
-
-                self._measure_split_time(checkpoint=1)
-                self._checkpoint_1_measured = True
-            elif button_id == self._buttons['stop_button_2']:
-                if self._checkpoint_2_measured:
-                    self._logger.warning(_("Repeated measure on checkpoint 2"))
+    def _start_watch(self, timestamp=None):
+        with self._lock:
+            if self._cleared and not self.is_running:
+                self._measure_split_time(checkpoint=4, timestamp=timestamp)
+                self._cleared = False
+                self._is_running = True
+                self._parent.post_on_ui_thread(self.STOPWATCH_STARTED)
+
+    def _measure_first_split_time(self, timestamp=None):
+        with self._lock:
+            if self.is_running:
+                if self._first_split_time_measured:
+                    self._logger.warning(_("Repeated measure on checkpoint 3"))
                     return
 
-                self._measure_split_time(checkpoint=2)
-                self._checkpoint_2_measured = True
+                self._measure_split_time(checkpoint=3, timestamp=timestamp)
+                self._first_split_time_measured = True
+
+    def _stop_watch(self, checkpoint: int, timestamp=None):
+        with self._lock:
+            if self._first_split_time_measured and self.is_running:
+                if checkpoint == 1:
+                    if self._checkpoint_1_measured:
+                        self._logger.warning(_("Repeated measure on checkpoint 1"))
+                        return
+
+                    self._measure_split_time(checkpoint=1, timestamp=timestamp)
+                    self._checkpoint_1_measured = True
+                elif checkpoint == 2:
+                    if self._checkpoint_2_measured:
+                        self._logger.warning(_("Repeated measure on checkpoint 2"))
+                        return
+
+                    self._measure_split_time(checkpoint=2, timestamp=timestamp)
+                    self._checkpoint_2_measured = True
+
+                # This method will be triggered by two sensors.
+                # The one which triggers last will stop the clock.
+                if self._should_stop_clock:
+                    self._is_running = False
+                    self._parent.post_on_ui_thread(self.STOPWATCH_STOPPED)
+                else:
+                    self._should_stop_clock = True
+
+    def rearm(self):
+        """ Reset the watch for the next run without operator's intervention. """
+        self._reset_watch(rearm=True)
+
+    def _reset_watch(self, rearm=False):
+        with self._lock:
+            self._cleared = True
+            self._is_running = False
+            self._should_stop_clock = False
+            self._first_split_time_measured = False
+            self._checkpoint_1_measured = False
+            self._checkpoint_2_measured = False
+            self._times = []
+            self._reset_time = time.time()
+            self._manual_measurement_running = False
+            self._parent.post_on_ui_thread(self.STOPWATCH_REARMED if rearm else self.STOPWATCH_RESET)
+
+    @tracing.traced('remote_edge')
+    def process_remote_edge(self, checkpoint: int, timestamp: float):
+        """
+        Feed a gate edge from a remote checkpoint node into the checkpoint state machine.
+        The timestamp must already be expressed in this machine's clock.
+        Edges older than the last reset, the start of the current run or `_MAX_REMOTE_EDGE_AGE_SECONDS`
+        are ignored.
+        """
+        with self._lock:
+            if timestamp < self._reset_time or (self._times and timestamp < self._times[0]) \
+                    or timestamp < time.time() - self._MAX_REMOTE_EDGE_AGE_SECONDS:
+                self._logger.warning(_("Ignoring stale edge on checkpoint {}").format(checkpoint))
+                return
 
-            # This method will be triggered by two sensors.
-            # The one which triggers last will stop the clock.
-            if self._should_stop_clock:
-                self._is_running = False
-                self._parent.post_on_ui_thread(self.STOPWATCH_STOPPED)
+            if checkpoint == 4:
+                self._start_watch(timestamp)
+            elif checkpoint == 3:
+                self._measure_first_split_time(timestamp)
+            elif checkpoint in (1, 2):
+                self._stop_watch(checkpoint, timestamp)
             else:
-                self._should_stop_clock = True
+                self._logger.warning(_("Unknown remote checkpoint {}").format(checkpoint))
 
-    def _reset_watch(self):
-        self._cleared = True
-        self._is_running = False
-        self._should_stop_clock = False
-        self._first_split_time_measured = False
-        self._checkpoint_1_measured = False
-        self._checkpoint_2_measured = False
-        self._times = []
-        self._manual_measurement_running = False
-        self._parent.post_on_ui_thread(self.STOPWATCH_RESET)
-
-    def _measure_split_time(self, checkpoint: int):
-        split_time = time.time()
+    def _measure_split_time(self, checkpoint: int, timestamp=None):
+        split_time = time.time() if timestamp is None else timestamp
         self._times.append(split_time)
+
+        if self._parent.capture is not None:
+            self._parent.capture.trigger('checkpoint_{}'.format(checkpoint), split_time)
+
         self._parent.post_on_ui_thread({self.SPLIT_TIME_MEASURED: self._format_time(split_time - self._times[0]),
-                                        self.CHECKPOINT: checkpoint})
+                                        self.CHECKPOINT: checkpoint,
+                                        self.SPLIT_SECONDS: split_time - self._times[0]})
 
     def _run_manual_measurement(self):
+        if self._parent.capture is not None:
+            self._parent.capture.trigger('manual')
+
         self._parent.post_on_ui_thread({self.MANUAL_MEASURE_STARTED: self.get_current_time()})
 
     @staticmethod
@@ -499,7 +759,8 @@ class StopWatch(object):
             return self._format_time(time.time() - self._times[0])
         elif len(self._times) > 1:
             # Do not reset stopwatch time yet. Instead show last split time.
-            return self._format_time(self._times[-1] - self._times[0])
+            # Remote edges may arrive out of order, so the last one is the latest timestamp.
+            return self._format_time(max(self._times) - self._times[0])
         else:
             return self._format_time(0)
 
@@ -532,8 +793,13 @@ class FlowMeter(object):
         except:
             self._flow_sensor = None
 
+    @tracing.traced('gpio:_update_flow')
     def _update_flow(self):
-        self._samples.append(time.time())
+        pulse_time = time.time()
+        self._samples.append(pulse_time)
+
+        if self._parent.capture is not None:
+            self._parent.capture.record_flow_pulse(pulse_time)
 
     def get_current_flow(self):
         # Don't bother computing flow if water pump is not running.
@@ -558,6 +824,9 @@ class PressureTransducer(object):
     # - voltage output:     0–10 V DC
 
     _SAMPLES_FOR_SLIDING_AVG = 25
+
+    # Pressure is sampled `avg_samples_no` times per second, this is the default rate
+    SAMPLES_PER_SECOND = _SAMPLES_FOR_SLIDING_AVG
     _MIN_PRESSURE = 0
     _MAX_PRESSURE = 100
 
@@ -625,10 +894,22 @@ class PressureTransducer(object):
     def _update_sliding_avg_pressure_thread(self):
         if self._i2c_initialized:
             self._is_measuring = True
-            self._voltage_1_samples.append(self._adc_channels[0].voltage)
-            self._voltage_2_samples.append(self._adc_channels[1].voltage)
+
+            with tracing.span('adc_read', channel=0):
+                voltage_1 = self._adc_channels[0].voltage
+                self._voltage_1_samples.append(voltage_1)
+
+            with tracing.span('adc_read', channel=1):
+                voltage_2 = self._adc_channels[1].voltage
+                self._voltage_2_samples.append(voltage_2)
+
             self._is_measuring = False
 
+            if self._parent.capture is not None:
+                self._parent.capture.record_pressure(time.time(), voltage_1, voltage_2,
+                                                     self._calculate_pressure_from_input_value(voltage_1),
+                                                     self._calculate_pressure_from_input_value(voltage_2))
+
     def get_current_pressure(self):
         return 0, 0 if not self._i2c_initialized else tuple(
             map(self._calculate_pressure_from_input_value,
@@ -706,8 +987,13 @@ class RpmMeter(object):
         except:
             self._rpm_sensor = None
 
+    @tracing.traced('gpio:_update_rpm')
     def _update_rpm(self):
-        self._samples.append(time.time())
+        pulse_time = time.time()
+        self._samples.append(pulse_time)
+
+        if self._parent.capture is not None:
+            self._parent.capture.record_rpm_pulse(pulse_time)
 
     def get_current_rpm(self):
         # The engine wasn't started or was just started.
@@ -0,0 +1,97 @@
+import csv
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from capture import CaptureRing, TriggerCapture
+
+
+class CaptureRingTest(unittest.TestCase):
+    def test_wraparound_keeps_newest_samples_oldest_first(self):
+        ring = CaptureRing(4)
+
+        for timestamp in range(10):
+            ring.append(timestamp)
+
+        self.assertEqual(ring.window(0, 100), [(6,), (7,), (8,), (9,)])
+
+    def test_partially_filled(self):
+        ring = CaptureRing(4)
+        ring.append(1)
+        ring.append(2)
+
+        self.assertEqual(ring.window(0, 100), [(1,), (2,)])
+
+    def test_window_bounds_are_inclusive(self):
+        ring = CaptureRing(8, width=5)
+
+        for timestamp in range(6):
+            ring.append(timestamp, timestamp + 0.1, timestamp + 0.2, timestamp * 10, timestamp * 20)
+
+        self.assertEqual(ring.window(2, 4), [(2, 2.1, 2.2, 20, 40), (3, 3.1, 3.2, 30, 60), (4, 4.1, 4.2, 40, 80)])
+        self.assertEqual(ring.window(2.5, 2.9), [])
+
+
+class TriggerCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _read_captures(self):
+        rows = []
+
+        for path in sorted(Path(self._directory.name).glob('capture_*.csv')):
+            with open(path, newline='') as f:
+                rows.append(list(csv.reader(f)))
+
+        return rows
+
+    def test_writes_window_around_trigger(self):
+        capture = TriggerCapture(self._directory.name, pre_seconds=1, post_seconds=0)
+        trigger_time = 1000.0
+
+        for offset in (-2, -0.5, 0, 0.5):
+            capture.record_rpm_pulse(trigger_time + offset)
+
+        capture.record_flow_pulse(trigger_time - 0.25)
+        capture.record_pressure(trigger_time - 0.1, 1.5, 2.25, 3.7, 4.2)
+        capture.record_pressure(trigger_time + 0.1, 1.0, 1.0, 1, 1)
+
+        capture.trigger('checkpoint_1', trigger_time)
+        capture.stop()
+
+        captures = self._read_captures()
+        self.assertEqual(len(captures), 1)
+        self.assertEqual(captures[0][1:], [['rpm', '-0.500000'],
+                                           ['rpm', '0.000000'],
+                                           ['flow', '-0.250000'],
+                                           ['pressure', '-0.100000', '1.5000', '2.2500', '3', '4']])
+        self.assertTrue(next(Path(self._directory.name).glob('capture_*.csv')).name.endswith('_checkpoint_1.csv'))
+
+    def test_stop_flushes_pending_triggers(self):
+        capture = TriggerCapture(self._directory.name, pre_seconds=1, post_seconds=60)
+        now = time.time()
+        capture.record_rpm_pulse(now - 0.5)
+
+        capture.trigger('checkpoint_1', now)
+        capture.trigger('checkpoint_2', now + 0.001)
+
+        stop_time = time.time()
+        capture.stop()
+
+        # Stopping doesn't wait for the post-trigger period
+        self.assertLess(time.time() - stop_time, 5)
+
+        captures = self._read_captures()
+        self.assertEqual(len(captures), 2)
+
+        for rows in captures:
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(rows[1][0], 'rpm')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+import unittest
+
+from checkpoint_node import CheckpointMaster, CheckpointNode, ClockSync, SimulatedClock, SimulatedLink
+
+
+class ClockSyncTest(unittest.TestCase):
+    def _exchange(self, clock_sync, master_time, local_clock, delay_out, delay_back):
+        """ Feed one sync exchange starting at a given master time, return the master time it ended. """
+        t2 = master_time + delay_out
+        t3 = t2 + 0.0001
+        end = t3 + delay_back
+        clock_sync.add_sample(local_clock(master_time), t2, t3, local_clock(end))
+        return end
+
+    def _run(self, clock_sync, local_clock, duration, interval, delay, jitter, seed=0):
+        rng = random.Random(seed)
+        master_time = 1000.0
+
+        while master_time < 1000.0 + duration:
+            master_time = self._exchange(clock_sync, master_time, local_clock,
+                                         delay + rng.uniform(-jitter, jitter), delay + rng.uniform(-jitter, jitter))
+            master_time += interval
+
+        return master_time
+
+    def test_constant_offset(self):
+        clock_sync = ClockSync()
+        end = self._run(clock_sync, lambda m: m + 0.8, duration=30, interval=0.5, delay=0.02, jitter=0)
+
+        self.assertTrue(clock_sync.is_synchronized)
+        self.assertAlmostEqual(clock_sync.drift, 0, places=9)
+        self.assertAlmostEqual(clock_sync.to_master_time(end + 0.8), end, places=6)
+
+    def test_no_drift_fit_on_short_span(self):
+        clock_sync = ClockSync()
+        self._run(clock_sync, lambda m: m + 0.8 + (m - 1000) * 300e-6, duration=2, interval=0.1, delay=0.02,
+                  jitter=0.015)
+
+        self.assertEqual(clock_sync.drift, 0)
+
+    def test_drift_with_jitter(self):
+        drift = 300e-6
+
+        def local_clock(master_time):
+            return master_time + 0.8 + (master_time - 1000) * drift
+
+        for seed in range(5):
+            clock_sync = ClockSync()
+            end = self._run(clock_sync, local_clock, duration=60, interval=0.5, delay=0.02, jitter=0.015, seed=seed)
+
+            # Local clock runs fast, so the offset to the master clock decreases
+            self.assertLess(abs(clock_sync.drift + drift), 150e-6)
+            self.assertLess(abs(clock_sync.to_master_time(local_clock(end)) - end), 0.003)
+
+
+class CheckpointUploadTest(unittest.TestCase):
+    _EDGES = 20
+
+    def setUp(self):
+        self._lock = threading.Lock()
+        self._received = []
+        link = SimulatedLink(delay=0.005, jitter=0.002, loss=0.3)
+        self._master = CheckpointMaster(self._on_edge, port=0, host='127.0.0.1', link=link)
+        self._master.start()
+        self._node = CheckpointNode('test', ('127.0.0.1', self._master.port), clock=SimulatedClock(offset=0.8),
+                                    link=SimulatedLink(delay=0.005, jitter=0.002, loss=0.3))
+        self._node.start()
+
+    def tearDown(self):
+        self._node.stop()
+        self._master.stop()
+
+    def _on_edge(self, node_id, checkpoint, timestamp):
+        with self._lock:
+            self._received.append((checkpoint, timestamp))
+
+    def _wait_for(self, condition, timeout):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.05)
+
+    def test_edges_delivered_exactly_once_over_lossy_link(self):
+        self._wait_for(lambda: self._node.clock_sync.is_synchronized, timeout=10)
+        self.assertTrue(self._node.clock_sync.is_synchronized)
+
+        # Checkpoint numbers are only used to tell edges apart here
+        true_times = {}
+        for checkpoint in range(self._EDGES):
+            true_times[checkpoint] = time.time()
+            self._node.record_edge(checkpoint)
+            time.sleep(0.02)
+
+        self._wait_for(lambda: len(self._received) >= self._EDGES, timeout=20)
+
+        # Give late retransmissions a chance to show up as duplicates
+        time.sleep(1)
+
+        with self._lock:
+            received = list(self._received)
+
+        self.assertEqual(sorted(checkpoint for checkpoint, _ in received), list(range(self._EDGES)))
+
+        for checkpoint, timestamp in received:
+            self.assertLess(abs(timestamp - true_times[checkpoint]), 0.005)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from run_lifecycle import RunManager, load_start_list
+
+
+class _FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RunManagerTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = _FakeClock()
+
+    def _manager(self, teams):
+        return RunManager(teams, undo_window_seconds=15, clock=self._clock)
+
+    @staticmethod
+    def _run(manager, stop_1, stop_2=None):
+        """ Start, measure and archive a run of the current team. """
+        manager.start_run()
+        manager.record_split(4, 0)
+        manager.record_split(3, stop_1 / 2)
+        manager.record_split(1, stop_1)
+
+        if stop_2 is not None:
+            manager.record_split(2, stop_2)
+
+        return manager.archive_run()
+
+    def test_best_total_across_runs(self):
+        manager = self._manager(['A', 'B', 'A', 'A'])
+
+        self.assertEqual(self._run(manager, 30, 31).total, 31)
+        self._run(manager, 29, 28)
+        self._run(manager, 26, 27)
+        self._run(manager, 40, 35)
+
+        self.assertEqual(manager.standings(), [('A', 27), ('B', 29)])
+        self.assertEqual(manager.rank('A'), 1)
+        self.assertEqual(manager.rank('B'), 2)
+
+    def test_undo_best_run(self):
+        manager = self._manager(['A', 'B', 'A'])
+        self._run(manager, 30, 31)
+        self._run(manager, 29, 28)
+        best_run = self._run(manager, 26, 27)
+
+        self.assertEqual(manager.rank('A'), 1)
+        self.assertIs(manager.undo_archive(), best_run)
+
+        self.assertEqual(manager.standings(), [('B', 29), ('A', 31)])
+        self.assertEqual(manager.rank('A'), 2)
+        self.assertEqual(manager.current_team, 'A')
+        self.assertIsNone(manager.last_archived)
+        self.assertFalse(manager.can_undo)
+
+    def test_run_with_one_stop_gate(self):
+        manager = self._manager(['A', 'B'])
+        run = self._run(manager, 30)
+
+        self.assertIsNone(run.total)
+        self.assertIsNone(manager.rank('A'))
+        self.assertEqual(manager.standings(), [])
+        self.assertEqual(manager.current_team, 'B')
+
+    def test_archive_past_end_of_start_list(self):
+        manager = self._manager(['A'])
+        self.assertIsNone(manager.next_team)
+        self._run(manager, 30, 31)
+
+        self.assertIsNone(manager.current_team)
+        self.assertIsNone(manager.next_team)
+
+        run = self._run(manager, 25, 26)
+        self.assertIsNone(run.team)
+        self.assertIsNone(manager.current_team)
+        self.assertEqual(manager.standings(), [('A', 31)])
+
+        # Undo returns to the end of the list, not to the last team
+        manager.undo_archive()
+        self.assertIsNone(manager.current_team)
+
+    def test_undo_expires(self):
+        manager = self._manager(['A', 'B'])
+        self._run(manager, 30, 31)
+
+        self._clock.now = 15
+        self.assertTrue(manager.can_undo)
+
+        self._clock.now = 15.1
+        self.assertFalse(manager.can_undo)
+        self.assertIsNone(manager.undo_archive())
+        self.assertEqual(manager.current_team, 'B')
+        self.assertEqual(manager.rank('A'), 1)
+
+    def test_new_run_ends_undo_window(self):
+        manager = self._manager(['A', 'B'])
+        self._run(manager, 30, 31)
+        manager.start_run()
+
+        self.assertFalse(manager.can_undo)
+
+    def test_discard_keeps_team(self):
+        manager = self._manager(['A', 'B'])
+        manager.start_run()
+        manager.discard_run()
+
+        self.assertIsNone(manager.current_run)
+        self.assertIsNone(manager.archive_run())
+        self.assertEqual(manager.current_team, 'A')
+
+    def test_run_ids_are_unique(self):
+        manager = self._manager(['A', 'B'])
+        first = manager.start_run()
+        manager.discard_run()
+
+        self.assertNotEqual(manager.start_run().run_id, first.run_id)
+
+
+class StartListTest(unittest.TestCase):
+    def test_load_start_list(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'start_list.csv'
+            path.write_text('# Team, note\nSDH Alpha, first\n\n  SDH Beta  \n')
+
+            self.assertEqual(load_start_list(path), ['SDH Alpha', 'SDH Beta'])
+
+
+if __name__ == '__main__':
+    unittest.main()
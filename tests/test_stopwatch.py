@@ -0,0 +1,64 @@
+import time
+import unittest
+
+try:
+    import stopwatch
+except (ImportError, OSError):
+    # Sensor libraries are only available on the Raspberry Pi
+    stopwatch = None
+
+
+class _FakeApp(object):
+    capture = None
+
+    def __init__(self):
+        self.events = []
+
+    def post_on_ui_thread(self, event):
+        self.events.append(event)
+
+
+@unittest.skipIf(stopwatch is None, 'stopwatch dependencies are not installed')
+class RemoteEdgeTest(unittest.TestCase):
+    def setUp(self):
+        self._app = _FakeApp()
+        self._watch = stopwatch.StopWatch(self._app)
+
+    def _measured_checkpoints(self):
+        return [event[stopwatch.StopWatch.CHECKPOINT] for event in self._app.events
+                if isinstance(event, dict) and stopwatch.StopWatch.SPLIT_TIME_MEASURED in event]
+
+    def test_accepts_edges_of_current_run(self):
+        start = time.time()
+        self._watch.process_remote_edge(4, start)
+        self._watch.process_remote_edge(3, start + 0.5)
+
+        self.assertTrue(self._watch.is_running)
+        self.assertEqual(self._measured_checkpoints(), [4, 3])
+
+    def test_rejects_edge_from_before_reset(self):
+        before_reset = time.time() - 1
+        self._watch._reset_watch()
+        self._watch.process_remote_edge(4, before_reset)
+
+        self.assertFalse(self._watch.is_running)
+        self.assertEqual(self._measured_checkpoints(), [])
+
+    def test_rejects_edge_from_before_run_start(self):
+        start = time.time()
+        self._watch.process_remote_edge(4, start)
+        self._watch.process_remote_edge(3, start - 0.1)
+
+        self.assertEqual(self._measured_checkpoints(), [4])
+
+    def test_rejects_edge_older_than_max_age(self):
+        # Pretend the last reset happened long ago, so only the age limit applies
+        self._watch._reset_time = time.time() - 10 * stopwatch.StopWatch._MAX_REMOTE_EDGE_AGE_SECONDS
+        self._watch.process_remote_edge(4, time.time() - stopwatch.StopWatch._MAX_REMOTE_EDGE_AGE_SECONDS - 1)
+
+        self.assertFalse(self._watch.is_running)
+        self.assertEqual(self._measured_checkpoints(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
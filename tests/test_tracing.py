@@ -0,0 +1,82 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from tracing import Tracer
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self._tracer = Tracer()
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = Path(self._directory.name) / 'trace.json'
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _record(self):
+        with self._tracer.span('span', checkpoint=1):
+            pass
+
+        self._tracer.instant('instant')
+        self._tracer.traced('traced_call')(lambda: None)()
+
+    def _in_thread(self, target):
+        thread = threading.Thread(target=target, name='Worker')
+        thread.start()
+        thread.join()
+
+    def _dump(self):
+        self._tracer.dump(self._path)
+
+        with open(self._path) as f:
+            return json.load(f)['traceEvents']
+
+    def test_dump_events_from_threads(self):
+        self._tracer.configure(dump_on_exit=False, dump_on_signal=False)
+        self._record()
+        self._in_thread(self._record)
+        events = self._dump()
+
+        self.assertEqual({event['ph'] for event in events}, {'X', 'i', 'M'})
+        self.assertEqual(len({event['tid'] for event in events}), 2)
+        self.assertEqual(sorted(event['args']['name'] for event in events if event['ph'] == 'M'),
+                         sorted([threading.current_thread().name, 'Worker']))
+
+        complete_events = [event for event in events if event['ph'] == 'X']
+        self.assertEqual(sorted(event['name'] for event in complete_events),
+                         ['span', 'span', 'traced_call', 'traced_call'])
+
+        for event in complete_events:
+            self.assertGreaterEqual(event['dur'], 0)
+
+        spans = [event for event in complete_events if event['name'] == 'span']
+        self.assertEqual(spans[0]['args'], {'checkpoint': 1})
+
+    def test_buffer_size_limits_events_per_thread(self):
+        self._tracer.configure(buffer_size=5, dump_on_exit=False, dump_on_signal=False)
+
+        def record_many():
+            for idx in range(20):
+                self._tracer.instant('instant', idx=idx)
+
+        record_many()
+        self._in_thread(record_many)
+        events = [event for event in self._dump() if event['ph'] == 'i']
+
+        self.assertEqual(len(events), 10)
+
+        for tid in {event['tid'] for event in events}:
+            # Only the most recent events are kept
+            self.assertEqual([event['args']['idx'] for event in events if event['tid'] == tid], list(range(15, 20)))
+
+    def test_disabled_tracer_records_nothing(self):
+        self._record()
+
+        self.assertEqual(self._dump(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
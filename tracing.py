@@ -0,0 +1,222 @@
+# coding=utf-8
+"""
+Opt-in tracing of hot paths.
+
+Spans and instant events are stored in a per-thread ring buffer, so recording doesn't need any locking
+and memory use stays bounded. The buffers can be dumped into a Chrome trace JSON file, which can be opened
+in chrome://tracing or https://ui.perfetto.dev. Every event carries the id of the thread which recorded it,
+so tick overruns and threads waiting for each other are visible on a timeline.
+
+When tracing is disabled (default), `span()` returns a shared no-op context manager and `traced()`
+calls the wrapped function directly.
+"""
+import atexit
+import functools
+import gettext
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from collections import deque
+
+t = gettext.translation('stopwatch', 'l10n', fallback=True)
+_ = t.gettext
+
+DEFAULT_BUFFER_SIZE = 20000
+DEFAULT_TRACE_PATH = 'stopwatch_trace.json'
+
+LOG_LEVEL = logging.WARNING
+
+# Event types as defined by the Chrome trace event format
+_COMPLETE_EVENT = 'X'
+_INSTANT_EVENT = 'i'
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('_buffer', '_name', '_args', '_start')
+
+    def __init__(self, buffer, name, args):
+        self._buffer = buffer
+        self._name = name
+        self._args = args
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        self._buffer.append((_COMPLETE_EVENT, self._name, self._start, end - self._start, self._args))
+        return False
+
+
+class Tracer(object):
+    def __init__(self):
+        self._logger = logging.getLogger('Tracer')
+        self._logger.setLevel(LOG_LEVEL)
+
+        self._enabled = False
+        self._buffer_size = DEFAULT_BUFFER_SIZE
+        self._path = DEFAULT_TRACE_PATH
+        self._local = threading.local()
+
+        # All per-thread buffers as (thread id, thread name, buffer)
+        self._buffers = []
+        self._lock = threading.Lock()
+
+        # Set from the signal handler, the dump itself runs in a worker thread
+        self._dump_requested = threading.Event()
+        self._dump_worker = None
+
+        # perf_counter() has an arbitrary origin, we'll convert it to wall clock time on dump
+        self._perf_origin = time.perf_counter()
+        self._wall_origin = time.time()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def configure(self, enabled=True, buffer_size=DEFAULT_BUFFER_SIZE, path=DEFAULT_TRACE_PATH,
+                  dump_on_exit=True, dump_on_signal=True):
+        """
+        Enable or disable tracing. When enabled, the trace is written into `path` on exit
+        and whenever the process receives SIGUSR1.
+        """
+        self._buffer_size = buffer_size
+        self._path = path
+        self._enabled = enabled
+
+        if not enabled:
+            return
+
+        if dump_on_exit:
+            atexit.register(self.dump)
+
+        if dump_on_signal and hasattr(signal, 'SIGUSR1'):
+            try:
+                # The handler runs on the main (UI) thread, it must not do the work itself
+                signal.signal(signal.SIGUSR1, lambda signum, frame: self._dump_requested.set())
+            except ValueError:
+                # Not called from the main thread
+                self._logger.warning(_("Unable to install SIGUSR1 handler, trace will be dumped on exit only."))
+                return
+
+            if self._dump_worker is None:
+                self._dump_worker = threading.Thread(target=self._dump_on_request, name='TraceDump')
+                self._dump_worker.daemon = True
+                self._dump_worker.start()
+
+    def _dump_on_request(self):
+        while True:
+            self._dump_requested.wait()
+            self._dump_requested.clear()
+            self.dump()
+
+    def _get_buffer(self):
+        try:
+            return self._local.buffer
+        except AttributeError:
+            buffer = deque(maxlen=self._buffer_size)
+            self._local.buffer = buffer
+            thread = threading.current_thread()
+
+            with self._lock:
+                self._buffers.append((threading.get_native_id(), thread.name, buffer))
+
+            return buffer
+
+    def span(self, name, **args):
+        """ Measure duration of a `with` block. """
+        if not self._enabled:
+            return _NULL_SPAN
+
+        return _Span(self._get_buffer(), name, args)
+
+    def instant(self, name, **args):
+        """ Record a single point in time, e.g. a tick overrun. """
+        if self._enabled:
+            self._get_buffer().append((_INSTANT_EVENT, name, time.perf_counter(), 0, args))
+
+    def traced(self, name=None):
+        """ Decorator which records each call of a function as a span. """
+
+        def decorator(func):
+            span_name = name if name is not None else func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self._enabled:
+                    return func(*args, **kwargs)
+
+                with _Span(self._get_buffer(), span_name, None):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def dump(self, path=None):
+        """ Write all buffered events into a Chrome trace JSON file. """
+        path = self._path if path is None else path
+        pid = os.getpid()
+        events = []
+
+        with self._lock:
+            buffers = list(self._buffers)
+
+        for tid, thread_name, buffer in buffers:
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+
+            # Copy first, the owning thread may append while we iterate
+            for event_type, name, start, duration, args in list(buffer):
+                event = {'ph': event_type, 'name': name, 'pid': pid, 'tid': tid,
+                         'ts': self._to_microseconds(start)}
+
+                if event_type == _COMPLETE_EVENT:
+                    event['dur'] = duration * 1e6
+                else:
+                    event['s'] = 't'
+
+                if args:
+                    event['args'] = args
+
+                events.append(event)
+
+        try:
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        except OSError:
+            self._logger.error(_("Unable to write trace file {}.").format(path))
+
+    def _to_microseconds(self, perf_time):
+        return (self._wall_origin + perf_time - self._perf_origin) * 1e6
+
+
+tracer = Tracer()
+
+configure = tracer.configure
+span = tracer.span
+instant = tracer.instant
+traced = tracer.traced
+dump = tracer.dump
+
+
+def enabled():
+    return tracer.enabled